@@ -2,18 +2,18 @@
 # main.py (ULTRA-OPTIMIZED FINAL VERSION)
 import uvicorn
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ConfigDict
 from typing import List, Dict, Any
 from datetime import datetime, timedelta
-import pytz
+import os
 import time
 import asyncio
 
 # Import optimized modules
 from src.parser_agent import parse_meeting_request
-from src.scheduler_logic import find_best_slot
-from src.calendar_client import get_calendar_events
+from src.scheduler_logic import find_best_slot, compute_search_window, IST
+from src.calendar_client import get_calendar_events_async, get_freebusy
 
 def clean_google_event(event: Dict) -> Dict:
     """Fast event cleaning with error handling"""
@@ -34,10 +34,25 @@ def clean_google_event(event: Dict) -> Dict:
     except (KeyError, TypeError, AttributeError):
         return None
 
+def busy_interval_to_event(interval: Dict) -> Dict:
+    """Normalize a FreeBusy interval or cleaned event into the response event shape"""
+    if 'StartTime' in interval:
+        return interval
+    # orjson serializes datetimes natively - no isoformat() needed
+    return {
+        "StartTime": interval['start'],
+        "EndTime": interval['end'],
+        "Summary": "Busy",
+        "NumAttendees": 0,
+        "Attendees": []
+    }
+
 class Attendee(BaseModel):
     email: str
 
 class MeetingRequest(BaseModel):
+    model_config = ConfigDict(extra='ignore')
+
     Request_id: str
     Datetime: str
     Location: str
@@ -49,7 +64,8 @@ class MeetingRequest(BaseModel):
 app = FastAPI(
     title="⚡ Turbo AI Scheduling Assistant",
     description="Ultra-optimized scheduling for AMD AI Hackathon",
-    version="2.0.0"
+    version="2.0.0",
+    default_response_class=ORJSONResponse  # 3-5x faster encoding than stdlib json
 )
 
 @app.middleware("http")
@@ -72,43 +88,71 @@ async def your_meeting_assistant(request: MeetingRequest) -> Dict[str, Any]:
     print(f"   Attendees: {len(request.Attendees)}")
     
     try:
-        # Step 1: Parse request (optimized)
-        parse_start = time.time()
-        parsed_data = parse_meeting_request(
-            email_text=request.EmailContent,
-            organizer_email=request.From,
-            attendees=request.Attendees
+        # Step 1+2: Parse and fetch busy intervals concurrently. The
+        # participant list comes straight from the payload, not the parse
+        # result, so the FreeBusy query never waits on the LLM fallback.
+        parse_start = fetch_start = time.time()
+        all_participants = [request.From] + [att.email for att in request.Attendees]
+        now_ist = datetime.now(IST)  # single clock read reused below
+
+        # Superset window: covers the urgent (+2d) and any next-weekday
+        # (9am-6pm within 7 days) search windows the parse could pick
+        prefetch_start_dt = now_ist.replace(minute=0, second=0, microsecond=0)
+        prefetch_end_dt = prefetch_start_dt + timedelta(days=8)
+
+        parsed_data, all_calendars = await asyncio.gather(
+            parse_meeting_request(
+                email_text=request.EmailContent,
+                organizer_email=request.From,
+                attendees=request.Attendees
+            ),
+            asyncio.to_thread(
+                get_freebusy,
+                emails=all_participants,
+                time_min=prefetch_start_dt.isoformat(),
+                time_max=prefetch_end_dt.isoformat()
+            )
         )
         parse_time = time.time() - parse_start
         print(f"   ✅ Parsing: {parse_time:.3f}s")
-        
+
         if "error" in parsed_data:
             raise HTTPException(status_code=400, detail=f"Parsing failed: {parsed_data['error']}")
-        
+
         # Extract parsed data
-        all_participants = parsed_data.get("participants", [])
         duration_mins = parsed_data.get("duration_mins", 30)
         time_constraints = parsed_data.get("time_constraints", "")
         day_of_week = parsed_data.get("day_of_week")
         is_urgent = parsed_data.get("is_urgent", False)
-        
+
         print(f"   📋 Parsed: {len(all_participants)} participants, {duration_mins}min, urgent={is_urgent}")
-        
-        # Step 2: Fetch calendars (with caching)
-        fetch_start = time.time()
-        search_start_dt = datetime.now(pytz.utc)
-        search_end_dt = search_start_dt + timedelta(days=14)
-        
-        all_calendars = {}
-        for email in all_participants:
-            raw_events = get_calendar_events(
+
+        # The scheduler clamps to the precise window inside the prefetched range
+        search_start_dt, search_end_dt = compute_search_window(day_of_week, is_urgent, now_ist)
+
+        async def fetch_and_clean(email: str) -> List[Dict]:
+            """Fallback path: fetch one user's full events (locked cache) and clean them"""
+            raw_events = await get_calendar_events_async(
                 user_email=email,
-                time_min=search_start_dt.isoformat(),
-                time_max=search_end_dt.isoformat()
+                time_min=prefetch_start_dt.isoformat(),
+                time_max=prefetch_end_dt.isoformat()
             )
-            cleaned_events = [clean_google_event(e) for e in raw_events if clean_google_event(e)]
-            all_calendars[email] = cleaned_events
-        
+            return [cleaned for e in raw_events if (cleaned := clean_google_event(e)) is not None]
+
+        # FreeBusy flags broken calendars with None - retry those via events.list
+        failed_emails = [email for email, busy in all_calendars.items() if busy is None]
+        if failed_emails:
+            results = await asyncio.gather(
+                *(fetch_and_clean(email) for email in failed_emails),
+                return_exceptions=True
+            )
+            for email, result in zip(failed_emails, results):
+                if isinstance(result, Exception):
+                    print(f"❌ Calendar fetch failed for {email}: {result}")
+                    all_calendars[email] = []
+                else:
+                    all_calendars[email] = result
+
         fetch_time = time.time() - fetch_start
         print(f"   ✅ Calendar fetch: {fetch_time:.3f}s")
         
@@ -119,7 +163,9 @@ async def your_meeting_assistant(request: MeetingRequest) -> Dict[str, Any]:
             duration_minutes=duration_mins,
             time_constraints=time_constraints,
             day_of_week=day_of_week,
-            is_urgent=is_urgent
+            is_urgent=is_urgent,
+            search_start=search_start_dt,
+            search_end=search_end_dt
         )
         schedule_time = time.time() - schedule_start
         print(f"   ✅ Scheduling: {schedule_time:.3f}s")
@@ -136,8 +182,8 @@ async def your_meeting_assistant(request: MeetingRequest) -> Dict[str, Any]:
         
         # Step 4: Assemble response (optimized)
         new_event = {
-            "StartTime": best_slot['start'].isoformat(),
-            "EndTime": best_slot['end'].isoformat(),
+            "StartTime": best_slot['start'],
+            "EndTime": best_slot['end'],
             "NumAttendees": len(all_participants),
             "Attendees": all_participants,
             "Summary": request.Subject
@@ -145,7 +191,7 @@ async def your_meeting_assistant(request: MeetingRequest) -> Dict[str, Any]:
         
         response_attendees = []
         for participant_email in all_participants:
-            participant_events = all_calendars.get(participant_email, [])
+            participant_events = [busy_interval_to_event(e) for e in all_calendars.get(participant_email, [])]
             participant_events.append(new_event)
             response_attendees.append({
                 "email": participant_email,
@@ -154,7 +200,7 @@ async def your_meeting_assistant(request: MeetingRequest) -> Dict[str, Any]:
         
         # Smart agent notes
         if is_urgent:
-            agent_notes = f"🚨 URGENT: Scheduled earliest available slot in {(best_slot['start'] - datetime.now(pytz.utc)).total_seconds() / 3600:.1f}h"
+            agent_notes = f"🚨 URGENT: Scheduled earliest available slot in {(best_slot['start'] - now_ist).total_seconds() / 3600:.1f}h"
         else:
             agent_notes = f"📅 Optimally scheduled for {best_slot['start'].strftime('%A %I:%M %p')}"
         
@@ -168,8 +214,8 @@ async def your_meeting_assistant(request: MeetingRequest) -> Dict[str, Any]:
             "Attendees": response_attendees,
             "Subject": request.Subject,
             "EmailContent": request.EmailContent,
-            "EventStart": best_slot['start'].isoformat(),
-            "EventEnd": best_slot['end'].isoformat(),
+            "EventStart": best_slot['start'],
+            "EventEnd": best_slot['end'],
             "Duration_mins": str(duration_mins),
             "MetaData": {
                 "status": "✅ Successfully Scheduled",
@@ -207,9 +253,12 @@ async def health_check():
 if __name__ == "__main__":
     print("🚀 Starting Turbo AI Scheduling Assistant...")
     uvicorn.run(
-        app,
+        "main:app",  # import string so uvicorn can fork multiple workers
         host="0.0.0.0",
         port=5000,
+        workers=os.cpu_count(),
+        loop="uvloop",
+        http="httptools",
         log_level="info",
         access_log=False  # Disable access logs for performance
     )
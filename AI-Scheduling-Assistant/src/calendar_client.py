@@ -1,7 +1,11 @@
 # src/calendar_client.py
 # src/calendar_client.py (CACHED VERSION)
 import os
-from typing import List, Dict
+import asyncio
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
 import time
@@ -15,23 +19,68 @@ TOKEN_MAPPING = {
     "kalilinux140235@gmail.com": "token_user3.json"
 }
 
-# Simple in-memory cache for calendar data
-_calendar_cache = {}
+# Simple in-memory LRU cache for calendar data
+_calendar_cache: OrderedDict = OrderedDict()
 _cache_timeout = 300  # 5 minutes
+_cache_max_entries = 1024  # cap so the cache can't leak memory
+
+# Per-key fetch locks so concurrent misses trigger exactly one Google call
+_fetch_locks: Dict[str, asyncio.Lock] = {}
+_fetch_locks_lock = asyncio.Lock()
+
+# One service per (thread, token file): the httplib2 transport that
+# build() wires in is NOT thread-safe, and fetches run in the asyncio
+# thread pool, so a process-wide memo would share a transport across
+# concurrent requests
+_thread_services = threading.local()
+
+def _get_service(token_file: str):
+    """Build the Calendar service once per token file per thread -
+    credential JSON parsing and HTTP transport setup cost tens of ms on
+    every call otherwise. cache_discovery=False since the memoized
+    service makes the file-based discovery cache redundant."""
+    services = getattr(_thread_services, 'services', None)
+    if services is None:
+        services = _thread_services.services = {}
+
+    service = services.get(token_file)
+    if service is None:
+        creds = Credentials.from_authorized_user_file(token_file, SCOPES)
+        service = build('calendar', 'v3', credentials=creds, cache_discovery=False)
+        services[token_file] = service
+    return service
+
+def _cache_key(user_email: str, time_min: str, time_max: str) -> str:
+    """Quantize window bounds to the hour so near-identical requests share entries"""
+    return f"{user_email}:{time_min[:13]}:{time_max[:13]}"
+
+def _cache_get(cache_key: str):
+    entry = _calendar_cache.get(cache_key)
+    if entry is None:
+        return None
+    cached_data, timestamp = entry
+    if time.time() - timestamp >= _cache_timeout:
+        _calendar_cache.pop(cache_key, None)
+        return None
+    _calendar_cache.move_to_end(cache_key)
+    return cached_data
+
+def _cache_put(cache_key: str, data) -> None:
+    _calendar_cache[cache_key] = (data, time.time())
+    _calendar_cache.move_to_end(cache_key)
+    while len(_calendar_cache) > _cache_max_entries:
+        _calendar_cache.popitem(last=False)
 
 def get_calendar_events(user_email: str, time_min: str, time_max: str) -> List[Dict]:
     """Optimized calendar fetching with caching"""
-    
+
     # Check cache first
-    cache_key = f"{user_email}:{time_min}:{time_max}"
-    current_time = time.time()
-    
-    if cache_key in _calendar_cache:
-        cached_data, timestamp = _calendar_cache[cache_key]
-        if current_time - timestamp < _cache_timeout:
-            print(f"📋 CACHE HIT: {user_email} ({len(cached_data)} events)")
-            return cached_data
-    
+    cache_key = _cache_key(user_email, time_min, time_max)
+    cached_data = _cache_get(cache_key)
+    if cached_data is not None:
+        print(f"📋 CACHE HIT: {user_email} ({len(cached_data)} events)")
+        return cached_data
+
     # Get token file
     token_file = TOKEN_MAPPING.get(user_email)
     if not token_file or not os.path.exists(token_file):
@@ -39,9 +88,8 @@ def get_calendar_events(user_email: str, time_min: str, time_max: str) -> List[D
         return []
     
     try:
-        creds = Credentials.from_authorized_user_file(token_file, SCOPES)
-        service = build('calendar', 'v3', credentials=creds)
-        
+        service = _get_service(token_file)
+
         events_result = service.events().list(
             calendarId='primary',
             timeMin=time_min,
@@ -52,17 +100,102 @@ def get_calendar_events(user_email: str, time_min: str, time_max: str) -> List[D
         ).execute()
         
         events = events_result.get('items', [])
-        
+
         # Cache the result
-        _calendar_cache[cache_key] = (events, current_time)
-        
+        _cache_put(cache_key, events)
+
         print(f"📅 FETCHED: {user_email} ({len(events)} events)")
         return events
-        
+
     except Exception as e:
         print(f"❌ Calendar fetch error for {user_email}: {e}")
         return []
 
+async def get_calendar_events_async(user_email: str, time_min: str, time_max: str) -> List[Dict]:
+    """Async fetch with a per-key lock: N concurrent misses for the same
+    window wait on one Google call instead of hammering the API (and the
+    quota) with a thundering herd."""
+    cache_key = _cache_key(user_email, time_min, time_max)
+
+    cached_data = _cache_get(cache_key)
+    if cached_data is not None:
+        print(f"📋 CACHE HIT: {user_email} ({len(cached_data)} events)")
+        return cached_data
+
+    async with _fetch_locks_lock:
+        fetch_lock = _fetch_locks.setdefault(cache_key, asyncio.Lock())
+
+    try:
+        async with fetch_lock:
+            # Re-check: another waiter may have populated the cache already
+            cached_data = _cache_get(cache_key)
+            if cached_data is not None:
+                print(f"📋 CACHE HIT: {user_email} ({len(cached_data)} events)")
+                return cached_data
+            return await asyncio.to_thread(get_calendar_events, user_email, time_min, time_max)
+    finally:
+        # Drop the lock entry once the fetch settles - waiters already
+        # hold a reference, and keeping one entry per key forever would
+        # grow without bound (the cache itself is LRU-capped)
+        _fetch_locks.pop(cache_key, None)
+
+def _parse_rfc3339(timestamp: str) -> datetime:
+    """FreeBusy returns strict RFC3339 with a 'Z' suffix"""
+    return datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+
+def get_freebusy(emails: List[str], time_min: str, time_max: str) -> Dict[str, Optional[List[Dict]]]:
+    """Batch busy-interval fetch: one freebusy.query covers every calendar.
+
+    Returns {email: [{'start': datetime, 'end': datetime}, ...]} with the
+    intervals already parsed. Calendars the API reports errors for map to
+    None so the caller can fall back to get_calendar_events for them.
+    """
+
+    # FreeBusy needs one authorized service; any participant's token works.
+    # A corrupt token file must not fail the request - flag every calendar
+    # for the events.list fallback instead.
+    service = None
+    try:
+        for email in emails:
+            token_file = TOKEN_MAPPING.get(email)
+            if token_file and os.path.exists(token_file):
+                service = _get_service(token_file)
+                break
+    except Exception as e:
+        print(f"❌ FreeBusy service setup failed: {e}, falling back to events.list")
+        return {email: None for email in emails}
+
+    if service is None:
+        print("⚠️  WARNING: No token available for FreeBusy query, returning empty calendars")
+        return {email: [] for email in emails}
+
+    try:
+        response = service.freebusy().query(body={
+            "timeMin": time_min,
+            "timeMax": time_max,
+            "items": [{"id": email} for email in emails]
+        }).execute()
+        calendars = response.get('calendars', {})
+    except Exception as e:
+        print(f"❌ FreeBusy query failed: {e}")
+        calendars = {}
+
+    busy_map = {}
+    for email in emails:
+        calendar_info = calendars.get(email)
+        if calendar_info is None or calendar_info.get('errors'):
+            # Per-calendar failure - let the caller retry via events.list
+            print(f"↩️  FreeBusy error for {email}, falling back to events.list")
+            busy_map[email] = None
+            continue
+        busy_map[email] = [
+            {'start': _parse_rfc3339(b['start']), 'end': _parse_rfc3339(b['end'])}
+            for b in calendar_info.get('busy', [])
+        ]
+        print(f"📅 FREEBUSY: {email} ({len(busy_map[email])} busy intervals)")
+
+    return busy_map
+
 
 
 
@@ -1,9 +1,20 @@
 # src/scheduler_logic.py
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import List, Dict, Any, Optional
-import pytz
-from dateutil import parser
+from zoneinfo import ZoneInfo
 import bisect
+import heapq
+import numpy as np
+from array import array
+
+# Cached tz objects - zoneinfo is stdlib and C-backed, and binding the
+# constants skips even its internal cache lookup
+IST = ZoneInfo("Asia/Kolkata")
+UTC = timezone.utc
+
+def _parse_iso(timestamp: str) -> datetime:
+    """Google Calendar timestamps are strict RFC3339 - fromisoformat is ~100x faster than dateutil"""
+    return datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
 
 def get_next_weekday(start_date: datetime, weekday_name: str) -> datetime:
     """Optimized weekday calculation"""
@@ -24,151 +35,241 @@ def get_next_weekday(start_date: datetime, weekday_name: str) -> datetime:
         days_ahead += 7
     return start_date + timedelta(days=days_ahead)
 
-def merge_busy_slots(busy_slots: List[Dict]) -> List[Dict]:
-    """Optimized slot merging using sorted approach"""
-    if not busy_slots:
-        return []
-    
-    # Sort by start time
-    busy_slots.sort(key=lambda x: x['start'])
-    
-    merged = [busy_slots[0]]
-    for current in busy_slots[1:]:
-        last_merged = merged[-1]
-        if current['start'] <= last_merged['end']:
-            # Overlapping slots - merge them
-            last_merged['end'] = max(last_merged['end'], current['end'])
+def compute_search_window(day_of_week: str, is_urgent: bool = False, now: datetime = None) -> tuple:
+    """Search window in IST: urgent -> now to +2 days, else 9am-6pm on the target day.
+
+    Exposed so callers can fetch exactly this window instead of a blanket
+    multi-day range.
+    """
+    if now is None:
+        now = datetime.now(IST)
+
+    if is_urgent:
+        # For urgent meetings, search starting from now
+        search_start = now.replace(minute=0, second=0, microsecond=0)
+        search_end = search_start + timedelta(days=2)
+    else:
+        # For regular meetings, use specified day or start tomorrow
+        if day_of_week:
+            target_day = get_next_weekday(now, day_of_week)
         else:
-            # Non-overlapping - add as new slot
-            merged.append(current)
-    
-    return merged
+            target_day = now + timedelta(days=1)  # Default to tomorrow
+
+        search_start = target_day.replace(hour=9, minute=0, second=0, microsecond=0)
+        search_end = target_day.replace(hour=18, minute=0, second=0, microsecond=0)
+
+    return search_start, search_end
+
+def merge_busy_slots(per_user_intervals: List[List[tuple]]) -> tuple:
+    """Sweep-line merge of per-user sorted (start_ep, end_ep) interval streams.
+
+    Each user's events are already sorted (orderBy='startTime' / FreeBusy),
+    so heapq.merge streams them in global order without a full re-sort,
+    and overlaps are coalesced on the fly in a single pass. Returns two
+    parallel array('q') of epoch seconds - integer compares in the gap
+    walk are a single C op with zero per-slot allocations.
+    """
+    starts = array('q')
+    ends = array('q')
+    cur_start = cur_end = None
+
+    for start, end in heapq.merge(*per_user_intervals, key=lambda x: x[0]):
+        if cur_start is None:
+            cur_start, cur_end = start, end
+        elif start <= cur_end:
+            # Overlapping - extend the running interval
+            if end > cur_end:
+                cur_end = end
+        else:
+            starts.append(cur_start)
+            ends.append(cur_end)
+            cur_start, cur_end = start, end
 
-def score_slot_fast(slot: Dict, is_urgent: bool, preferences: Dict = None) -> int:
-    """Ultra-fast scoring algorithm"""
-    start_time = slot['start']
+    if cur_start is not None:
+        starts.append(cur_start)
+        ends.append(cur_end)
+
+    return starts, ends
+
+def slot_is_free(busy_starts, busy_ends, start_ep: int, end_ep: int) -> bool:
+    """O(log B) conflict check against the merged, sorted busy arrays.
+
+    Count busy intervals starting before the slot ends and busy intervals
+    ending by the time the slot starts; the slot is free iff the counts
+    match (every interval that begins before our end has also finished).
+    """
+    return bisect.bisect_left(busy_starts, end_ep) == bisect.bisect_right(busy_ends, start_ep)
+
+def score_slot_fast(start_ep: int, is_urgent: bool, tz_offset_s: int, now_ep: int) -> int:
+    """Ultra-fast scoring on integer epoch seconds; now_ep is captured once
+    by the caller so scoring stays pure and clock-read free"""
     score = 100
-    
+
     if is_urgent:
         # For urgent meetings, heavily prioritize earliest slots
-        time_diff_hours = (start_time - datetime.now(pytz.utc)).total_seconds() / 3600
+        time_diff_hours = (start_ep - now_ep) / 3600
         if time_diff_hours < 48:  # Next 2 days
             return 1000 - int(time_diff_hours * 20)
         else:
             return 50
-    
-    # Standard scoring
-    hour = start_time.hour
-    
+
+    # Standard scoring - local hour from pure integer arithmetic
+    hour = ((start_ep + tz_offset_s) // 3600) % 24
+
     # Business hours preference
     if 9 <= hour <= 17:
         score += 20
-    
+
     # Optimal meeting times
     if 10 <= hour <= 11 or 14 <= hour <= 16:
         score += 10
-    
+
     # Avoid lunch time
     if 12 <= hour <= 13:
         score -= 10
-    
+
     # Avoid very early or very late
     if hour < 9 or hour > 17:
         score -= 30
-    
+
     return score
 
+def score_slots_vectorized(start_eps: np.ndarray, tz_offset_s: int) -> np.ndarray:
+    """Same non-urgent rules as score_slot_fast, applied to all candidates at once"""
+    hours = ((start_eps + tz_offset_s) // 3600) % 24
+    scores = np.full_like(start_eps, 100)
+    scores += 20 * ((hours >= 9) & (hours <= 17))
+    scores += 10 * (((hours >= 10) & (hours <= 11)) | ((hours >= 14) & (hours <= 16)))
+    scores -= 10 * ((hours >= 12) & (hours <= 13))
+    scores -= 30 * ((hours < 9) | (hours > 17))
+    return scores
+
 def find_best_slot(
-    calendars: Dict[str, List[Dict]], 
+    calendars: Dict[str, List[Dict]],
     duration_minutes: int,
-    time_constraints: str, 
-    day_of_week: str, 
-    is_urgent: bool = False
+    time_constraints: str,
+    day_of_week: str,
+    is_urgent: bool = False,
+    search_start: datetime = None,
+    search_end: datetime = None
 ) -> Optional[Dict]:
-    """Ultra-optimized slot finding with intelligent search"""
-    
+    """Ultra-optimized slot finding with intelligent search.
+
+    Callers that already computed the window (to fetch exactly those
+    bounds) pass search_start/search_end; otherwise it is derived here.
+    """
+
     print(f"🚀 TURBO SCHEDULER: Finding slot for {len(calendars)} participants")
     print(f"   Duration: {duration_minutes}min, Day: {day_of_week}, Urgent: {is_urgent}")
-    
-    tz = pytz.timezone("Asia/Kolkata")
-    now = datetime.now(tz)
-    
-    # Smart search window based on urgency and day
-    if is_urgent:
-        # For urgent meetings, search starting from now
-        search_start = now.replace(minute=0, second=0, microsecond=0)
-        search_end = search_start + timedelta(days=2)
-    else:
-        # For regular meetings, use specified day or start tomorrow
-        if day_of_week:
-            target_day = get_next_weekday(now, day_of_week)
-        else:
-            target_day = now + timedelta(days=1)  # Default to tomorrow
-        
-        search_start = target_day.replace(hour=9, minute=0, second=0, microsecond=0)
-        search_end = target_day.replace(hour=18, minute=0, second=0, microsecond=0)
-    
+
+    if search_start is None or search_end is None:
+        search_start, search_end = compute_search_window(day_of_week, is_urgent)
+
+    tz = search_start.tzinfo
+
     print(f"   Search window: {search_start} to {search_end}")
-    
-    # Collect and merge all busy slots
-    all_busy_slots = []
+
+    # Work in integer epoch seconds from here on - no datetime arithmetic
+    # or timedelta allocations in the hot loops
+    search_start_ep = int(search_start.timestamp())
+    search_end_ep = int(search_end.timestamp())
+    duration_s = duration_minutes * 60
+    tz_offset_s = int(search_start.utcoffset().total_seconds())
+    now_ep = int(datetime.now(UTC).timestamp())  # one clock read per request
+
+    # Collect each user's busy intervals as sorted (start_ep, end_ep) streams
+    per_user_intervals = []
     for email, events in calendars.items():
+        intervals = []
         for event in events:
             try:
-                start = parser.parse(event['StartTime'])
-                end = parser.parse(event['EndTime'])
-                
-                # Only include events that overlap with search window
-                if end > search_start and start < search_end:
-                    all_busy_slots.append({'start': start, 'end': end})
+                if 'start' in event:
+                    # FreeBusy intervals arrive pre-parsed as datetimes
+                    start_ep = int(event['start'].timestamp())
+                    end_ep = int(event['end'].timestamp())
+                else:
+                    start_ep = int(_parse_iso(event['StartTime']).timestamp())
+                    end_ep = int(_parse_iso(event['EndTime']).timestamp())
+
+                # No window filter needed: fetches are already bounded by
+                # timeMin/timeMax and the gap walk clamps to the window
+                intervals.append((start_ep, end_ep))
             except (KeyError, TypeError, ValueError):
                 continue
+        per_user_intervals.append(intervals)
+
+    # Single-pass k-way merge into two parallel epoch-second arrays
+    busy_starts, busy_ends = merge_busy_slots(per_user_intervals)
     
-    # Merge overlapping busy slots
-    merged_busy_slots = merge_busy_slots(all_busy_slots)
-    
-    # Find available slots with optimized algorithm
-    available_slots = []
-    slot_start = search_start
-    
-    for busy_slot in merged_busy_slots:
-        # Check gap before this busy slot
-        gap_end = busy_slot['start']
-        
-        # Generate slots in this gap
-        while slot_start + timedelta(minutes=duration_minutes) <= gap_end:
-            slot_end = slot_start + timedelta(minutes=duration_minutes)
-            available_slots.append({'start': slot_start, 'end': slot_end})
-            slot_start += timedelta(minutes=15)  # 15-minute increments
-        
-        # Move past this busy slot
-        slot_start = max(slot_start, busy_slot['end'])
-    
-    # Check for slots after the last busy period
-    while slot_start + timedelta(minutes=duration_minutes) <= search_end:
-        slot_end = slot_start + timedelta(minutes=duration_minutes)
-        available_slots.append({'start': slot_start, 'end': slot_end})
-        slot_start += timedelta(minutes=15)
-    
-    if not available_slots:
+    # Walk the gaps between merged busy slots - no need to enumerate
+    # every 15-minute candidate, the best slot in a gap is deterministic
+    def iter_gaps():
+        gap_start = search_start_ep
+        for busy_start, busy_end in zip(busy_starts, busy_ends):
+            if busy_start > gap_start:
+                yield gap_start, min(busy_start, search_end_ep)
+            gap_start = max(gap_start, busy_end)
+            if gap_start >= search_end_ep:
+                return
+        if gap_start < search_end_ep:
+            yield gap_start, search_end_ep
+
+    best_start_ep = None
+    best_score = -1
+
+    if is_urgent:
+        # Urgent scoring is monotonic in start time, so earliest-fit is optimal
+        for gap_start, gap_end in iter_gaps():
+            if gap_end - gap_start >= duration_s:
+                best_start_ep = gap_start
+                best_score = score_slot_fast(best_start_ep, is_urgent, tz_offset_s, now_ep)
+                break
+    else:
+        # Preferred anchors (10am/2pm local) as epoch seconds on the target day
+        anchor_eps = [
+            int(search_start.replace(hour=h, minute=0, second=0, microsecond=0).timestamp())
+            for h in (10, 14)
+        ]
+        candidate_list = []
+        for gap_start, gap_end in iter_gaps():
+            latest_start = gap_end - duration_s
+            if latest_start < gap_start:
+                continue
+            # Best slot in a gap starts at the gap or at a preferred anchor
+            candidate_starts = {gap_start}
+            for anchor_ep in anchor_eps:
+                candidate_starts.add(min(max(gap_start, anchor_ep), latest_start))
+            candidate_list.extend(candidate_starts)
+
+        # The raw anchors can also be checked directly against the merged
+        # arrays - a bisect probe instead of locating their gap
+        for anchor_ep in anchor_eps:
+            if (search_start_ep <= anchor_ep and anchor_ep + duration_s <= search_end_ep
+                    and slot_is_free(busy_starts, busy_ends, anchor_ep, anchor_ep + duration_s)):
+                candidate_list.append(anchor_ep)
+
+        if candidate_list:
+            # Score every candidate in one vectorized pass; sorted so ties
+            # resolve to the earliest start (argmax keeps the first max)
+            candidate_list = sorted(set(candidate_list))
+            candidate_eps = np.fromiter(candidate_list, dtype=np.int64)
+            scores = score_slots_vectorized(candidate_eps, tz_offset_s)
+            best_idx = int(scores.argmax())
+            best_start_ep = int(candidate_eps[best_idx])
+            best_score = int(scores[best_idx])
+
+    if best_start_ep is None:
         print("   ❌ No available slots found")
         return None
-    
-    print(f"   ✅ Found {len(available_slots)} potential slots")
-    
-    # Score and select best slot
-    best_slot = None
-    best_score = -1
-    
-    for slot in available_slots:
-        score = score_slot_fast(slot, is_urgent)
-        if score > best_score:
-            best_score = score
-            best_slot = slot
-    
-    if best_slot:
-        print(f"   🎯 Selected slot: {best_slot['start'].strftime('%A %I:%M %p')} (Score: {best_score})")
-    
+
+    # Only the winning slot gets converted back to tz-aware datetimes
+    best_slot = {
+        'start': datetime.fromtimestamp(best_start_ep, tz=tz),
+        'end': datetime.fromtimestamp(best_start_ep + duration_s, tz=tz)
+    }
+
+    print(f"   🎯 Selected slot: {best_slot['start'].strftime('%A %I:%M %p')} (Score: {best_score})")
+
     return best_slot
 
 